@@ -1,9 +1,11 @@
 import os, sys
+import argparse
 from textual.app import App, ComposeResult
 from textual import on
 from textual.widgets import Header, Footer, Button, ContentSwitcher, Static
 from textual.containers import Horizontal, Vertical
 from utils.vault_client import VaultManager
+from utils.profiler import StallProfiler
 
 from widgets.secrets import SecretsWidget
 from widgets.identity import IdentityWidget
@@ -19,13 +21,23 @@ class VaultTUI(App):
         ("q", "quit", "Quit"),
     ]
 
-    def __init__(self):
+    def __init__(self, profiler=None):
         super().__init__()
+        self.profiler = profiler
         self.vault = VaultManager(
             url=os.getenv("VAULT_ADDR", "http://127.0.0.1:8200"),
             token=os.getenv("VAULT_TOKEN", "vault-root-token")
         )
 
+    def on_load(self) -> None:
+        # before compose, so the widgets' first loads in on_mount are measured too
+        if self.profiler:
+            self.profiler.start()
+
+    def on_unmount(self) -> None:
+        if self.profiler:
+            self.profiler.stop()
+
     def compose(self) -> ComposeResult:
         yield Header()
         with Horizontal(id="nav-bar"):
@@ -58,5 +70,28 @@ class VaultTUI(App):
             view_id = event.button.id.replace("nav-", "")
             self.action_switch_view(view_id)
 
+def run():
+    parser = argparse.ArgumentParser(prog="v4t", description="Terminal UI for Hashicorp Vault")
+    parser.add_argument("--profile", action="store_true", help="measure event loop stalls and write a report on exit")
+    parser.add_argument("--profile-threshold", type=float, default=100, metavar="MS", help="report stalls longer than this (default: 100)")
+    parser.add_argument("--profile-output", metavar="FILE", help="report file (default: v4t-profile-<time>.txt)")
+    parser.add_argument("--profile-cprofile", action="store_true", help="keep a cProfile snapshot of the slowest call per handler")
+    parser.add_argument("--profile-tracemalloc", action="store_true", help="record allocations made during each stall")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile:
+        profiler = StallProfiler(
+            threshold=args.profile_threshold / 1000,
+            use_cprofile=args.profile_cprofile,
+            use_tracemalloc=args.profile_tracemalloc
+        )
+
+    VaultTUI(profiler=profiler).run()
+
+    if profiler:
+        path = profiler.write_report(args.profile_output)
+        print(f"Profile report written to {path}")
+
 if __name__ == "__main__":
-    VaultTUI().run()
\ No newline at end of file
+    run()
\ No newline at end of file
@@ -0,0 +1,123 @@
+class GroupGraph:
+    # member_group_ids point from a parent group to its subgroups, members of a
+    # subgroup inherit the policies of every group above it
+    def __init__(self, groups=()):
+        self.groups = {}         # group id -> group data
+        self.children = {}       # group id -> member group ids
+        self.parents = {}        # group id -> ids of groups it is a member of
+        self.entity_groups = {}  # entity id -> direct group ids
+        self._ancestors = {}
+        self._descendants = {}
+        for g in groups:
+            self._add(g)
+
+    def _add(self, group):
+        gid = group["id"]
+        self.groups[gid] = group
+        self.children.setdefault(gid, set())
+        self.parents.setdefault(gid, set())
+        for child in group.get("member_group_ids") or []:
+            self.children[gid].add(child)
+            self.parents.setdefault(child, set()).add(gid)
+            self.children.setdefault(child, set())
+        for eid in group.get("member_entity_ids") or []:
+            self.entity_groups.setdefault(eid, set()).add(gid)
+
+    ### closure
+    def _walk(self, start, edges):
+        seen = {start}
+        stack = [start]
+        while stack:
+            for nxt in edges.get(stack.pop(), ()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return frozenset(seen)
+
+    def ancestors(self, group_id):
+        # the group itself and every group it inherits from
+        if group_id not in self._ancestors:
+            self._ancestors[group_id] = self._walk(group_id, self.parents)
+        return self._ancestors[group_id]
+
+    def descendants(self, group_id):
+        # the group itself and every subgroup below it
+        if group_id not in self._descendants:
+            self._descendants[group_id] = self._walk(group_id, self.children)
+        return self._descendants[group_id]
+
+    def members(self, group_id):
+        entity_ids = set()
+        for gid in self.descendants(group_id):
+            entity_ids.update(self.groups.get(gid, {}).get("member_entity_ids") or [])
+        return entity_ids
+
+    def direct_groups(self, entity_id, direct_group_ids=()):
+        # internal memberships come from the groups, the entity only adds external groups
+        direct = set(self.entity_groups.get(entity_id, set()))
+        for gid in direct_group_ids or []:
+            if gid not in self.groups or self.groups[gid].get("type") == "external":
+                direct.add(gid)
+        return direct
+
+    def effective_groups(self, entity_id, direct_group_ids=()):
+        effective = set()
+        for gid in self.direct_groups(entity_id, direct_group_ids):
+            effective |= self.ancestors(gid)
+        return effective
+
+    def effective_policies(self, entity):
+        policies = set(entity.get("policies") or [])
+        for gid in self.effective_groups(entity["id"], entity.get("direct_group_ids")):
+            policies.update(self.groups.get(gid, {}).get("policies") or [])
+        return policies
+
+    def names(self, group_ids):
+        return sorted(self.groups[gid]["name"] if gid in self.groups else gid for gid in group_ids)
+
+    def cycles(self):
+        # Tarjan, every strongly connected component with more than one group (or a self reference) is a cycle
+        index, low, on_stack, stack, found = {}, {}, set(), [], []
+        counter = [0]
+
+        def visit(node):
+            index[node] = low[node] = counter[0]
+            counter[0] += 1
+            stack.append(node)
+            on_stack.add(node)
+            for nxt in self.children.get(node, ()):
+                if nxt not in index:
+                    visit(nxt)
+                    low[node] = min(low[node], low[nxt])
+                elif nxt in on_stack:
+                    low[node] = min(low[node], index[nxt])
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    n = stack.pop()
+                    on_stack.discard(n)
+                    component.append(n)
+                    if n == node:
+                        break
+                if len(component) > 1 or node in self.children.get(node, ()):
+                    found.append(component)
+
+        for node in list(self.children):
+            if node not in index:
+                visit(node)
+        return found
+
+    ### incremental updates after edits
+    # only entity members and policies are edited here, group to group edges never
+    # change so the cached ancestors/descendants stay valid
+    def set_entity_members(self, group_id, entity_ids):
+        group = self.groups[group_id]
+        old, new = set(group.get("member_entity_ids") or []), set(entity_ids)
+        for eid in old - new:
+            self.entity_groups.get(eid, set()).discard(group_id)
+        for eid in new - old:
+            self.entity_groups.setdefault(eid, set()).add(group_id)
+        group["member_entity_ids"] = list(entity_ids)
+
+    def set_policies(self, group_id, policies):
+        self.groups[group_id]["policies"] = list(policies)
@@ -0,0 +1,70 @@
+import re
+
+TOKEN = re.compile(r"\w+")
+
+
+class PolicyIndex:
+    # inverted index over policy lines: token -> {(policy name, line number)}
+    def __init__(self):
+        self.docs = {}      # name -> rules
+        self._lines = {}    # name -> rules split in lines
+        self._postings = {}
+
+    def __contains__(self, name):
+        return name in self.docs
+
+    def __len__(self):
+        return len(self.docs)
+
+    def update(self, name, rules):
+        if self.docs.get(name) == rules:
+            return
+        self.remove(name)
+        self.docs[name] = rules
+        self._lines[name] = lines = rules.splitlines()
+        for no, line in enumerate(lines, 1):
+            for token in set(TOKEN.findall(line.lower())):
+                self._postings.setdefault(token, set()).add((name, no))
+
+    def remove(self, name):
+        if name not in self.docs:
+            return
+        for no, line in enumerate(self._lines.pop(name), 1):
+            for token in set(TOKEN.findall(line.lower())):
+                postings = self._postings.get(token)
+                if postings is not None:
+                    postings.discard((name, no))
+                    if not postings:
+                        del self._postings[token]
+        del self.docs[name]
+
+    def retain(self, names):
+        for name in set(self.docs) - set(names):
+            self.remove(name)
+
+    def search(self, query):
+        # -> {name: [(line number, line), ...]} for every line containing the query
+        q = query.lower().strip()
+        if not q:
+            return {}
+
+        candidates = None
+        for qt in set(TOKEN.findall(q)):
+            # substring match on the vocabulary so partly typed words still hit
+            hits = set()
+            for token, postings in self._postings.items():
+                if qt in token:
+                    hits |= postings
+            candidates = hits if candidates is None else candidates & hits
+            if not candidates:
+                return {}
+        if candidates is None:
+            # nothing to look up, e.g. a bare "*"
+            candidates = {(name, no) for name, lines in self._lines.items() for no in range(1, len(lines) + 1)}
+
+        results = {}
+        for name, no in sorted(candidates):
+            line = self._lines[name][no - 1]
+            if q in line.lower():
+                results.setdefault(name, []).append((no, line))
+        return results
@@ -0,0 +1,310 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+
+from textual.message_pump import MessagePump
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VAULT_CLIENT_FILE = os.path.join(PROJECT_ROOT, "utils", "vault_client.py")
+ASYNCIO_EVENTS_FILE = os.path.join("asyncio", "events.py")
+# v4t's own modules, PROJECT_ROOT is site-packages itself when v4t is installed
+APP_FILE = os.path.join(PROJECT_ROOT, "app.py")
+APP_PACKAGES = tuple(os.path.join(PROJECT_ROOT, pkg) + os.sep for pkg in ("widgets", "utils"))
+
+
+def _is_project_frame(frame):
+    filename = frame.f_code.co_filename
+    return filename != __file__ and (filename == APP_FILE or filename.startswith(APP_PACKAGES))
+
+
+class Stall:
+    def __init__(self, started, handler=None, message=None, stack=None):
+        self.started = started
+        self.handler = handler
+        self.message = message
+        self.stack = stack or []
+        self.vault_calls = Counter()
+        self.duration = 0.0
+        self.snapshot = None
+        self.memory = []
+
+
+class StallProfiler:
+    def __init__(self, threshold=0.1, interval=0.02, use_cprofile=False, use_tracemalloc=False):
+        self.threshold = threshold
+        self.interval = interval
+        self.use_cprofile = use_cprofile
+        self.use_tracemalloc = use_tracemalloc
+
+        self.lags = deque(maxlen=100_000)
+        self.stalls = []
+        self.handlers = {}          # name -> [count, total, max]
+        self.handler_profiles = {}  # name -> (elapsed, pstats text) of the slowest call
+
+        self.started_at = None
+        self._start = 0.0
+        self._loop = None
+        self._loop_thread_id = None
+        self._lock = threading.Lock()
+        self._last_beat = 0.0
+        self._current_stall = None
+        self._active = {}           # asyncio task -> [(pump, message), ...]
+        self._profiling = False
+        self._running = False
+        self._heartbeat_task = None
+        self._watchdog = None
+        self._original_dispatch = None
+        self._started_tracemalloc = False
+
+    ### lifecycle, start() must run on the event loop thread
+    def start(self):
+        if self._running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self.started_at = datetime.now()
+        self._start = self._last_beat = time.perf_counter()
+        self._running = True
+
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            self._started_tracemalloc = True
+
+        self._install_dispatch_hook()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="v4t-stall-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        if self._original_dispatch is not None:
+            MessagePump._dispatch_message = self._original_dispatch
+            self._original_dispatch = None
+        if self._heartbeat_task and not self._heartbeat_task.done() and not self._loop.is_closed():
+            self._heartbeat_task.cancel()
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    ### event loop lag
+    async def _heartbeat(self):
+        while self._running:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self.lags.append(lag)
+
+            with self._lock:
+                stall, self._current_stall = self._current_stall, None
+                if stall is None and lag >= self.threshold:
+                    # too short for the watchdog to sample, keep it without attribution
+                    stall = Stall(expected - self._start)
+                if stall is not None:
+                    stall.duration = lag
+                    self._finish_stall(stall)
+                # restart the clock so time spent in _finish_stall is not reported as a stall
+                self._last_beat = time.perf_counter()
+
+    def _finish_stall(self, stall):
+        if stall.snapshot is not None and tracemalloc.is_tracing():
+            after = tracemalloc.take_snapshot()
+            stall.memory = [str(s) for s in after.compare_to(stall.snapshot, "lineno")[:10]]
+            stall.snapshot = None
+        self.stalls.append(stall)
+
+    ### watchdog thread, samples the loop thread while it is blocked
+    def _watch(self):
+        poll = min(self.interval, self.threshold) / 2
+        while self._running:
+            time.sleep(poll)
+            if time.perf_counter() - self._last_beat < self.interval + self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            with self._lock:
+                if time.perf_counter() - self._last_beat < self.interval + self.threshold:
+                    continue
+                stall = self._current_stall
+                if stall is None:
+                    stall = self._new_stall(frame)
+                    self._current_stall = stall
+
+            vault_call = self._vault_call(frame)
+            if vault_call:
+                stall.vault_calls[vault_call] += 1
+
+    def _new_stall(self, frame):
+        frames = []
+        f = frame
+        while f is not None:
+            frames.append(f)
+            f = f.f_back
+
+        # the handler is the outermost project frame of the innermost chain of project frames
+        handler = None
+        for f in frames:
+            if f.f_code.co_filename.endswith(ASYNCIO_EVENTS_FILE):
+                # everything above this is the event loop itself
+                break
+            if _is_project_frame(f):
+                handler = f.f_code.co_qualname
+            elif handler:
+                break
+
+        message = None
+        try:
+            task = asyncio.current_task(self._loop)
+            active = self._active.get(task)
+            if active:
+                pump, msg = active[-1]
+                message = f"{type(msg).__name__} -> {type(pump).__name__}.{msg.handler_name}"
+        except Exception:
+            pass
+
+        stack = traceback.format_list(traceback.extract_stack(frame)[-15:])
+        stall = Stall(self._last_beat - self._start, handler, message, stack)
+        if tracemalloc.is_tracing():
+            stall.snapshot = tracemalloc.take_snapshot()
+        return stall
+
+    @staticmethod
+    def _vault_call(frame):
+        f = frame
+        while f is not None:
+            code = f.f_code
+            if code.co_filename == VAULT_CLIENT_FILE and code.co_qualname.startswith("VaultManager."):
+                return code.co_qualname
+            f = f.f_back
+        return None
+
+    ### per handler timing
+    def _install_dispatch_hook(self):
+        original = MessagePump._dispatch_message
+        profiler = self
+
+        async def _dispatch_message(pump, message):
+            if not profiler._running:
+                return await original(pump, message)
+
+            task = asyncio.current_task()
+            active = profiler._active.setdefault(task, [])
+            active.append((pump, message))
+
+            prof = None
+            if profiler.use_cprofile and not profiler._profiling:
+                prof = cProfile.Profile()
+                profiler._profiling = True
+                prof.enable()
+
+            start = time.perf_counter()
+            try:
+                return await original(pump, message)
+            finally:
+                elapsed = time.perf_counter() - start
+                if prof is not None:
+                    prof.disable()
+                    profiler._profiling = False
+                active.pop()
+                if not active:
+                    profiler._active.pop(task, None)
+                profiler._record_handler(f"{type(pump).__name__}.{message.handler_name}", elapsed, prof)
+
+        self._original_dispatch = original
+        MessagePump._dispatch_message = _dispatch_message
+
+    def _record_handler(self, name, elapsed, prof):
+        stats = self.handlers.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+        if prof is None or elapsed < self.threshold:
+            return
+        if name in self.handler_profiles and self.handler_profiles[name][0] >= elapsed:
+            return
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(20)
+        self.handler_profiles[name] = (elapsed, out.getvalue())
+
+    ### report
+    def write_report(self, path=None):
+        self.stop()
+        if path is None:
+            stamp = (self.started_at or datetime.now()).strftime("%Y%m%d-%H%M%S")
+            path = f"v4t-profile-{stamp}.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.report())
+        return path
+
+    def report(self):
+        ms = lambda seconds: f"{seconds * 1000:.1f} ms"
+        lines = [
+            "v4t profile report",
+            f"started: {self.started_at:%Y-%m-%d %H:%M:%S}" if self.started_at else "started: -",
+            f"stall threshold: {ms(self.threshold)}, sample interval: {ms(self.interval)}",
+            f"cProfile: {'on' if self.use_cprofile else 'off'}, tracemalloc: {'on' if self.use_tracemalloc else 'off'}",
+            "",
+            "== Event loop lag ==",
+        ]
+
+        lags = sorted(self.lags)
+        if lags:
+            pct = lambda p: lags[min(len(lags) - 1, int(len(lags) * p))]
+            lines.append(
+                f"samples: {len(lags)}  p50: {ms(pct(0.5))}  p95: {ms(pct(0.95))}  "
+                f"p99: {ms(pct(0.99))}  max: {ms(lags[-1])}"
+            )
+        else:
+            lines.append("no samples")
+
+        lines += ["", f"== Stalls over {ms(self.threshold)} ({len(self.stalls)}) =="]
+        for i, stall in enumerate(sorted(self.stalls, key=lambda s: s.duration, reverse=True), 1):
+            vault = ", ".join(f"{name} ({n} samples)" for name, n in stall.vault_calls.most_common()) or "-"
+            if stall.handler:
+                handler = stall.handler
+            elif stall.stack:
+                handler = "- (no v4t code on the stack)"
+            else:
+                handler = "- (ended before it could be sampled)"
+            lines += [
+                f"{i}. {ms(stall.duration)} at +{stall.started:.1f}s",
+                f"   handler: {handler}",
+                f"   message: {stall.message or '-'}",
+                f"   vault:   {vault}",
+            ]
+            if stall.stack:
+                lines.append("   stack:")
+                lines += ["     " + l for entry in stall.stack for l in entry.rstrip().splitlines()]
+            if stall.memory:
+                lines.append("   allocations while stalled:")
+                lines += ["     " + m for m in stall.memory]
+
+        lines += ["", "== Handlers by max wall time (includes awaits) =="]
+        lines.append(f"{'handler':<60} {'calls':>7} {'total':>12} {'max':>12}")
+        ranked = sorted(self.handlers.items(), key=lambda kv: kv[1][2], reverse=True)[:30]
+        for name, (count, total, worst) in ranked:
+            lines.append(f"{name:<60} {count:>7} {ms(total):>12} {ms(worst):>12}")
+
+        if self.handler_profiles:
+            lines += ["", "== cProfile of the slowest call per handler =="]
+            for name, (elapsed, text) in sorted(self.handler_profiles.items(), key=lambda kv: kv[1][0], reverse=True):
+                lines += ["", f"-- {name} ({ms(elapsed)}) --", text.rstrip()]
+
+        return "\n".join(lines) + "\n"
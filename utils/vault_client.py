@@ -1,10 +1,35 @@
+import json
+import re
+import time
 import hvac
+import hvac.exceptions
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+
+SEARCH_WORKERS = 16
+# seconds a sys/capabilities-self answer is trusted, policies can change outside the tui
+CAPABILITIES_TTL = 60
+
+# capabilities that allow an operation, checked against sys/capabilities-self
+REQUIRED_CAPABILITIES = {
+    "list": {"list"},
+    "read": {"read"},
+    "write": {"create", "update"},
+    "patch": {"patch"},
+    "delete": {"delete"},
+}
+
+class SecretConflictError(Exception):
+    pass
 
 class VaultManager:
     def __init__(self, url="http://127.0.0.1:8200", token=None):
         self.url = url.rstrip('/')
         self.token = token
         self.client = hvac.Client(url=url, token=token)
+        self._pool_size = 0
+        self._kv_versions = {}
+        self._capabilities = {}  # path -> (capabilities, expires)
 
     ### secrets
     def list_mounts(self):
@@ -13,7 +38,7 @@ class VaultManager:
             data = mounts.get("data", mounts) if isinstance(mounts, dict) else mounts
             
             if data and isinstance(data, dict):
-                return {k: v for k, v in data.items() if isinstance(v, dict) and v.get('type') in ['kv', 'generic']}
+                return self._remember_versions({k: v for k, v in data.items() if isinstance(v, dict) and v.get('type') in ['kv', 'generic']})
         except Exception:
             pass
 
@@ -21,55 +46,103 @@ class VaultManager:
             res = self.client.read("sys/mounts")
             if res and isinstance(res, dict):
                 data = res.get("data", res)
-                return {k: v for k, v in data.items() if isinstance(v, dict) and v.get('type') in ['kv', 'generic']}
+                return self._remember_versions({k: v for k, v in data.items() if isinstance(v, dict) and v.get('type') in ['kv', 'generic']})
         except Exception:
             pass
         
         return {}
 
+    def _remember_versions(self, mounts):
+        for path, info in mounts.items():
+            options = info.get("options") or {}
+            self._kv_versions[path.strip("/")] = 2 if str(options.get("version", "1")) == "2" else 1
+        return mounts
+
     def list_keys(self, mount_path, path=""):
         mount = mount_path.strip("/")
         p = path.strip("/")
-        try:
-            res = self.client.secrets.kv.v2.list_secrets(
-                path=p,
-                mount_point=mount
-            )
-            return res.get("data", {}).get("keys", [])
-        except Exception:
+        # skip the KV v2 attempt on mounts already known to be v1
+        if self._kv_versions.get(mount) != 1:
             try:
-                res = self.client.sys.list_mounted_backends()
-                path_to_list = f"{mount}/{p}".rstrip("/")
-                res = self.client.read(f"{path_to_list}?list=true")
-                return res.get("data", {}).get("keys", []) if res else []
+                res = self.client.secrets.kv.v2.list_secrets(
+                    path=p,
+                    mount_point=mount
+                )
+                return res.get("data", {}).get("keys", [])
             except Exception:
-                return []
-
-    def read_secret(self, mount, path):
+                pass
         try:
-            response = self.client.secrets.kv.v2.read_secret_version(
-                mount_point=mount,
-                path=path
-            )
-            return response['data']['data']
+            path_to_list = f"{mount}/{p}".rstrip("/")
+            res = self.client.read(f"{path_to_list}?list=true")
+            return res.get("data", {}).get("keys", []) if res else []
         except Exception:
-            res = self.client.read(f"{mount}/{path}")
-            return res.get("data", {}) if res else {}
+            return []
 
-    def save_secret(self, mount_path, key_path, data):
+    def read_secret(self, mount, path):
+        return self.read_secret_with_version(mount, path)[0]
+
+    def read_secret_with_version(self, mount, path, raise_on_deleted=True):
+        # raise_on_deleted=False returns {} for a deleted latest version instead of trying KV v1
+        if self._kv_versions.get(mount.strip("/")) != 1:
+            try:
+                response = self.client.secrets.kv.v2.read_secret_version(
+                    mount_point=mount,
+                    path=path,
+                    raise_on_deleted_version=raise_on_deleted
+                )
+                return response['data']['data'] or {}, response['data']['metadata'].get('version')
+            except Exception:
+                pass
+        # KV v1 has no versions
+        res = self.client.read(f"{mount}/{path}")
+        return (res.get("data", {}) if res else {}), None
+
+    def save_secret(self, mount_path, key_path, data, cas=None):
         mount = mount_path.strip("/")
         key = key_path.lstrip("/")
         try:
             # KV v2
-            self.client.secrets.kv.v2.create_or_update_secret(
+            res = self.client.secrets.kv.v2.create_or_update_secret(
                 path=key,
                 secret=data,
+                cas=cas,
                 mount_point=mount
             )
+            return res.get("data", {}).get("version") if isinstance(res, dict) else None
+        except hvac.exceptions.InvalidRequest as e:
+            if cas is not None and "check-and-set" in str(e):
+                raise self._conflict(key, cas)
+            self.client.write(f"{mount}/{key}", **data)
         except Exception:
             # KV v1
             self.client.write(f"{mount}/{key}", **data)
 
+    @staticmethod
+    def _conflict(key, cas):
+        if cas == 0:
+            return SecretConflictError(f"'{key}' already exists")
+        return SecretConflictError(f"'{key}' was changed by someone else since version {cas}")
+
+    def patch_secret(self, mount_path, key_path, data, cas=None):
+        # KV v2 only, JSON merge patch: only the given fields are sent, None removes a field
+        mount = mount_path.strip("/")
+        key = key_path.lstrip("/")
+        payload = {"data": data}
+        if cas is not None:
+            payload["options"] = {"cas": cas}
+        try:
+            res = self.client.adapter.request(
+                "PATCH",
+                f"/v1/{mount}/data/{key}",
+                json=payload,
+                headers={"Content-Type": "application/merge-patch+json"}
+            )
+        except hvac.exceptions.InvalidRequest as e:
+            if cas is not None and "check-and-set" in str(e):
+                raise self._conflict(key, cas)
+            raise
+        return res.get("data", {}).get("version") if isinstance(res, dict) else None
+
     def delete_secret(self, mount, path):
         try:
             self.client.secrets.kv.v2.delete_metadata_and_all_versions(
@@ -90,11 +163,143 @@ class VaultManager:
         raise Exception("Source path is empty or not found")
 
 
+    def kv_version(self, mount_path):
+        mount = mount_path.strip("/")
+        if mount not in self._kv_versions:
+            self.list_mounts()
+        return self._kv_versions.get(mount, 1)
+
+    ### capabilities
+    def capabilities(self, paths):
+        # one sys/capabilities-self request for all paths that are not cached or expired
+        paths = list(paths)
+        now = time.monotonic()
+        missing = list(dict.fromkeys(p for p in paths if self._capabilities.get(p, (None, 0))[1] <= now))
+        if missing:
+            try:
+                res = self.client.write("sys/capabilities-self", paths=missing)
+                data = (res.get("data") or res) if isinstance(res, dict) else {}
+                for p in missing:
+                    caps = data.get(p, data.get("capabilities") if len(missing) == 1 else None)
+                    self._capabilities[p] = (caps, now + CAPABILITIES_TTL)
+            except Exception:
+                # unknown, the request itself will tell
+                return {p: None if p in missing else self._capabilities[p][0] for p in paths}
+        return {p: self._capabilities[p][0] for p in paths}
+
+    def clear_capabilities(self):
+        self._capabilities.clear()
+
+    @staticmethod
+    def allows(capabilities, operation):
+        if capabilities is None or "root" in capabilities:
+            return True
+        if "deny" in capabilities:
+            return False
+        return bool(REQUIRED_CAPABILITIES[operation] & set(capabilities))
+
+    def secret_api_path(self, mount_path, path, operation):
+        mount = mount_path.strip("/")
+        p = path.lstrip("/")
+        if self.kv_version(mount) == 2:
+            return f"{mount}/{'metadata' if operation in ('list', 'delete') else 'data'}/{p}"
+        return f"{mount}/{p}"
+
+    def secret_permissions(self, mount_path, checks):
+        # checks: [(path, operation), ...] -> {(path, operation): bool}, one request for the whole view
+        api_paths = {check: self.secret_api_path(mount_path, *check) for check in checks}
+        caps = self.capabilities(api_paths.values())
+        return {check: self.allows(caps[api_path], check[1]) for check, api_path in api_paths.items()}
+
+    def can_secret(self, mount_path, path, operation):
+        return self.secret_permissions(mount_path, [(path, operation)])[(path, operation)]
+
+    def search_secrets(self, mount_path, prefix, pattern, regex=False, workers=SEARCH_WORKERS, cancelled=None):
+        # yields (path, [(field, snippet), ...]) for every secret read, values are never kept
+        mount = mount_path.strip("/")
+        prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+        matcher = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE)
+        # known up front, so list_keys and read_secret_with_version go straight to the right API
+        self.kv_version(mount)
+        self._ensure_pool(workers)
+
+        def list_dir(path):
+            keys = self.list_keys(mount, path)
+            # drop what the token may not list or read before any request is made for it
+            checks = {key: (f"{path}{key}", "list" if key.endswith("/") else "read") for key in keys}
+            allowed = self.secret_permissions(mount, checks.values())
+            return [key for key, check in checks.items() if allowed[check]]
+
+        def read(path):
+            try:
+                return self.read_secret_with_version(mount, path, raise_on_deleted=False)[0]
+            except Exception:
+                return {}
+
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="v4t-search")
+        pending = {pool.submit(list_dir, prefix): (True, prefix)}
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if cancelled and cancelled():
+                    return
+                for fut in done:
+                    is_list, path = pending.pop(fut)
+                    if is_list:
+                        for key in fut.result():
+                            child = f"{path}{key}"
+                            if key.endswith("/"):
+                                pending[pool.submit(list_dir, child)] = (True, child)
+                            else:
+                                pending[pool.submit(read, child)] = (False, child)
+                        continue
+
+                    hits = []
+                    for field, value in fut.result().items():
+                        text = value if isinstance(value, str) else json.dumps(value)
+                        if matcher.search(field):
+                            hits.append((field, "key match"))
+                        else:
+                            m = matcher.search(text)
+                            if m:
+                                hits.append((field, self._mask_match(text, m, reveal=not regex)))
+                    yield path, hits
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _mask_match(text, match, reveal=True):
+        found = match.group(0)
+        if not reveal:
+            found = found[:2] + "*" * max(0, len(found) - 2)
+        before = "*" * min(match.start(), 3)
+        after = "*" * min(len(text) - match.end(), 3)
+        return f"{before}{found}{after}"
+
+    def _ensure_pool(self, size):
+        # requests keeps 10 connections per host by default, too few for parallel reads
+        if self._pool_size >= size:
+            return
+        adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+        self.client.adapter.session.mount("http://", adapter)
+        self.client.adapter.session.mount("https://", adapter)
+        self._pool_size = size
+
     ## identity and group
-    def list_entities(self):
+    def list_entities(self, name_filter=""):
         try:
+            if name_filter.startswith("="):
+                # exact entity name, one lookup instead of listing everything
+                ent = self.lookup_entity(name=name_filter[1:].strip())
+                return [ent] if ent else []
             res = self.client.read("identity/entity/id?list=true")
-            keys = res.get("data", {}).get("keys", []) if res else []
+            data = res.get("data", {}) if res else {}
+            keys = data.get("keys", [])
+            if name_filter:
+                # the LIST response carries names in key_info, so only matching entities are fetched
+                key_info = data.get("key_info") or {}
+                term = name_filter.lower()
+                keys = [eid for eid in keys if term in self._entity_label(key_info.get(eid) or {}).lower()]
             entities = []
             for eid in keys:
                 ent = self.client.read(f"identity/entity/id/{eid}")
@@ -121,13 +326,48 @@ class VaultManager:
             print(f"VAULT CLIENT ERROR (list_groups): {e}")
             return []
 
+    def read_entity(self, entity_id):
+        try:
+            res = self.client.read(f"identity/entity/id/{entity_id}")
+            return res.get("data") if res else None
+        except Exception:
+            return None
+
+    def read_group(self, group_id):
+        try:
+            res = self.client.read(f"identity/group/id/{group_id}")
+            return res.get("data") if res else None
+        except Exception:
+            return None
+
+    def lookup_entity(self, name=None, entity_id=None, alias_id=None, alias_name=None, alias_mount_accessor=None):
+        try:
+            res = self.client.secrets.identity.lookup_entity(
+                name=name,
+                entity_id=entity_id,
+                alias_id=alias_id,
+                alias_name=alias_name,
+                alias_mount_accessor=alias_mount_accessor
+            )
+            return res.get("data") if isinstance(res, dict) else None
+        except Exception:
+            return None
+
+    @staticmethod
+    def _entity_label(info):
+        aliases = info.get("aliases") or []
+        names = [info.get("name", "")] + [a.get("name", "") for a in aliases if isinstance(a, dict)]
+        return " ".join(n for n in names if n)
+
     def update_group_members(self, group_id, name, entity_ids):
         try:
             payload = {
                 "name": name,
                 "member_entity_ids": entity_ids
             }
-            return self.client.write(f"identity/group/id/{group_id}", **payload)
+            res = self.client.write(f"identity/group/id/{group_id}", **payload)
+            self.clear_capabilities()
+            return res
         except Exception as e:
             raise Exception(f"Could not update group: {e}")
 
@@ -155,11 +395,15 @@ class VaultManager:
 
     def update_entity_policies(self, entity_id, name, policies):
         payload = {"name": name, "policies": policies}
-        return self.client.write(f"identity/entity/id/{entity_id}", **payload)
+        res = self.client.write(f"identity/entity/id/{entity_id}", **payload)
+        self.clear_capabilities()
+        return res
 
     def update_group_policies(self, group_id, name, policies):
         payload = {"name": name, "policies": policies}
-        return self.client.write(f"identity/group/id/{group_id}", **payload)
+        res = self.client.write(f"identity/group/id/{group_id}", **payload)
+        self.clear_capabilities()
+        return res
 
     ### policies
     def list_policies(self) -> list:
@@ -179,9 +423,28 @@ class VaultManager:
         except Exception as e:
             return f"# Could not fetch policy: {str(e)}"
 
+    def read_policy(self, name):
+        # like get_policy, but None instead of an error text when it cannot be read
+        try:
+            policy = self.client.sys.read_policy(name)
+            return policy.get("rules", "") if isinstance(policy, dict) else policy
+        except Exception:
+            return None
+
+    def get_policies(self, names, workers=SEARCH_WORKERS) -> dict:
+        # fetches all bodies concurrently, policies that cannot be read are left out
+        self._ensure_pool(workers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="v4t-policies") as pool:
+            bodies = zip(names, pool.map(self.read_policy, names))
+            return {name: rules for name, rules in bodies if rules is not None}
+
     def save_policy(self, name: str, rules: str):
-        return self.client.sys.create_or_update_policy(name=name, policy=rules)
+        res = self.client.sys.create_or_update_policy(name=name, policy=rules)
+        self.clear_capabilities()
+        return res
 
     def delete_policy(self, name: str):
-        return self.client.sys.delete_policy(name)
+        res = self.client.sys.delete_policy(name)
+        self.clear_capabilities()
+        return res
 
@@ -1,7 +1,7 @@
 from textual import on
 from textual.screen import ModalScreen
 from textual.app import ComposeResult
-from textual.widgets import Label, Input, Button, SelectionList
+from textual.widgets import Label, Input, Button, SelectionList, Checkbox
 from textual.widgets.selection_list import Selection
 from textual.containers import Horizontal, Vertical
 
@@ -28,6 +28,32 @@ class PathDialog(ModalScreen):
     def cancel(self):
         self.dismiss(None)
 
+class SearchDialog(ModalScreen):
+    def __init__(self, scope):
+        super().__init__()
+        self.scope = scope
+
+    def compose(self) -> ComposeResult:
+        with Vertical(id="modal-container"):
+            yield Label(f"Search in: {self.scope}", id="modal-title")
+            yield Input(placeholder="Text in keys or values...", id="search-input")
+            yield Checkbox("Regex", id="search-regex")
+            with Horizontal(id="modal-buttons"):
+                yield Button("Search", variant="success", id="save")
+                yield Button("Abort", variant="error", id="cancel")
+
+    @on(Input.Submitted, "#search-input")
+    @on(Button.Pressed, "#save")
+    def confirm(self):
+        pattern = self.query_one("#search-input").value
+        if not pattern:
+            return
+        self.dismiss((pattern, self.query_one("#search-regex").value))
+
+    @on(Button.Pressed, "#cancel")
+    def cancel(self):
+        self.dismiss(None)
+
 class PolicySelectModal(ModalScreen):
     def __init__(self, all_policies, current_policies, title="Choose Policies"):
         super().__init__()
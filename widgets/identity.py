@@ -1,10 +1,11 @@
 import asyncio
 from textual import on
 from textual.app import ComposeResult
-from textual.widgets import DataTable, ListView, ListItem, Label, Static
+from textual.widgets import DataTable, ListView, ListItem, Label, Input, Static
 from textual.containers import Horizontal, Vertical
 
 from widgets.dialogs import PolicySelectModal
+from utils.group_graph import GroupGraph
 
 class IdentityWidget(Static):
     BINDINGS = [
@@ -12,12 +13,20 @@ class IdentityWidget(Static):
         ("r", "remove_from_group", "Remove from Group"),
         ("p", "manage_policies", "Handle Policies"),
         ("g", "manage_groups", "Handle Groups"),
+        ("ctrl+r", "reload_identity", "Reload"),
     ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.entity_filter = ""
+        self.entities = []
+        self.group_graph = GroupGraph()
+
     def compose(self) -> ComposeResult:
         with Horizontal():
             with Vertical(id="entity-side"):
                 yield Label("󰏓 USERS (Entities)", classes="header-label")
+                yield Input(placeholder="Filter users by name, =name for an exact match...", id="entity-filter")
                 yield DataTable(id="entity-table")
             
             with Vertical(id="group-side"):
@@ -26,48 +35,58 @@ class IdentityWidget(Static):
 
     async def on_mount(self) -> None:
         table = self.query_one("#entity-table", DataTable)
-        table.add_columns("Name", "ID", "Policies", "Groups")
+        table.add_columns("Name", "ID", "Policies", "Groups", "Effective Groups", "Effective Policies")
         table.cursor_type = "row"
         await self.refresh_all()
 
     async def refresh_all(self):
         await asyncio.sleep(0.1)
+        self.group_graph = GroupGraph(self.app.vault.list_groups() or [])
+        cycles = self.group_graph.cycles()
+        if cycles:
+            names = "; ".join(" -> ".join(self.group_graph.names(c)) for c in cycles)
+            self.notify(f"Group membership cycle: {names}", severity="warning")
         self.refresh_entities()
         self.refresh_groups()
 
     def refresh_entities(self):
         try:
-            table = self.query_one("#entity-table", DataTable)
-            current_cursor = table.cursor_coordinate
-            table.clear(columns=False)
-            
-            entities = self.app.vault.list_entities()
-            groups = self.app.vault.list_groups() or []
-            group_map = {g['id']: g['name'] for g in groups}
-            
-            for ent in entities:
-                g_ids = ent.get("direct_group_ids") or []
-                g_names = [group_map.get(gid, gid) for gid in g_ids]
-                p_list = ", ".join(ent.get("policies", [])) or "-"
-                
-                table.add_row(
-                    #ent["name"],
-                    ent["aliases"][0]["name"],
-                    ent["id"], 
-                    p_list,
-                    ", ".join(sorted(g_names)) if g_names else "-",
-                    key=ent["id"]
-                )
-            if current_cursor:
-                try: table.move_cursor(row=current_cursor.row)
-                except: pass
+            self.entities = self.app.vault.list_entities(self.entity_filter)
+            self.render_entities()
         except Exception as e:
             self.notify(f"Entity Refresh Error: {e}", severity="error")
 
+    def render_entities(self):
+        # built from the cached entities and group graph, no Vault calls
+        table = self.query_one("#entity-table", DataTable)
+        current_cursor = table.cursor_coordinate
+        table.clear(columns=False)
+        graph = self.group_graph
+
+        for ent in self.entities:
+            g_names = graph.names(graph.direct_groups(ent["id"], ent.get("direct_group_ids")))
+            p_list = ", ".join(ent.get("policies", [])) or "-"
+            effective_groups = graph.names(graph.effective_groups(ent["id"], ent.get("direct_group_ids")))
+            effective_policies = sorted(graph.effective_policies(ent))
+
+            table.add_row(
+                #ent["name"],
+                (ent.get("aliases") or [{}])[0].get("name", ent.get("name", "-")),
+                ent["id"], 
+                p_list,
+                ", ".join(g_names) if g_names else "-",
+                ", ".join(effective_groups) or "-",
+                ", ".join(effective_policies) or "-",
+                key=ent["id"]
+            )
+        if current_cursor:
+            try: table.move_cursor(row=current_cursor.row)
+            except: pass
+
     def refresh_groups(self):
         try:
             lst = self.query_one("#group-list", ListView)
-            groups = self.app.vault.list_groups()
+            groups = sorted(self.group_graph.groups.values(), key=lambda g: g["name"])
             old_index = lst.index
             lst.clear()
             
@@ -83,6 +102,16 @@ class IdentityWidget(Static):
         except Exception as e:
             self.notify(f"Group Refresh Error: {e}", severity="error")
 
+    async def action_reload_identity(self):
+        # picks up groups, memberships and policies changed outside this session
+        await self.refresh_all()
+        self.notify("Reloaded users and groups")
+
+    @on(Input.Submitted, "#entity-filter")
+    def handle_entity_filter(self, event):
+        self.entity_filter = event.value.strip()
+        self.refresh_entities()
+
     async def action_manage_policies(self):
         table = self.query_one("#entity-table", DataTable)
         group_list = self.query_one("#group-list", ListView)
@@ -100,18 +129,25 @@ class IdentityWidget(Static):
         row_key, _ = table.coordinate_to_cell_key(table.cursor_coordinate)
         entity_id = str(row_key.value)
         
-        entities = self.app.vault.list_entities()
-        entity = next((e for e in entities if e["id"] == entity_id), None)
+        entity = self.app.vault.read_entity(entity_id)
         
         if entity:
             def handle_save(new_policies):
                 if new_policies is not None:
                     self.app.vault.update_entity_policies(entity_id, entity["name"], new_policies)
                     self.notify(f"Policies updated for {entity['name']}")
-                    self.run_worker(self.refresh_all())
+                    for ent in self.entities:
+                        if ent["id"] == entity_id:
+                            ent["policies"] = list(new_policies)
+                    self.render_entities()
+
+            inherited = self.group_graph.effective_policies({**entity, "policies": []})
+            title = f"Policies: {entity['name']}"
+            if inherited:
+                title += f" (inherited: {', '.join(sorted(inherited))})"
             
             self.app.push_screen(
-                PolicySelectModal(all_policies, entity.get("policies", []), f"Policies: {entity['name']}"), 
+                PolicySelectModal(all_policies, entity.get("policies", []), title), 
                 handle_save
             )
 
@@ -120,9 +156,8 @@ class IdentityWidget(Static):
         row_key, _ = table.coordinate_to_cell_key(table.cursor_coordinate)
         user_id = str(row_key.value)
         
-        all_groups = self.app.vault.list_groups()
-        entities = self.app.vault.list_entities()
-        user_data = next((e for e in entities if e["id"] == user_id), None)
+        all_groups = list(self.group_graph.groups.values())
+        user_data = self.app.vault.read_entity(user_id)
         
         if not user_data or not all_groups: return
 
@@ -135,18 +170,22 @@ class IdentityWidget(Static):
             for group in all_groups:
                 g_id = group['id']
                 g_name = group['name']
-                members = set(group.get('member_entity_ids') or [])
-                
-                if g_name in selected_names and user_id not in members:
+                wanted = g_name in selected_names
+                if wanted == (user_id in (group.get('member_entity_ids') or [])):
+                    continue
+
+                # only the groups that change are re-read, so other edits are not overwritten
+                fresh = self.app.vault.read_group(g_id) or group
+                members = set(fresh.get('member_entity_ids') or [])
+                if wanted:
                     members.add(user_id)
-                    self.app.vault.update_group_members(g_id, g_name, list(members))
-                
-                elif g_name not in selected_names and user_id in members:
-                    members.remove(user_id)
-                    self.app.vault.update_group_members(g_id, g_name, list(members))
+                else:
+                    members.discard(user_id)
+                self.app.vault.update_group_members(g_id, g_name, list(members))
+                self.group_graph.set_entity_members(g_id, list(members))
             
             self.notify(f"Group memberships synced for {user_data['name']}")
-            self.run_worker(self.refresh_all())
+            self.render_entities()
 
         self.app.push_screen(
             PolicySelectModal(group_names, current_groups, f"Groups for: {user_data['name']}"),
@@ -171,10 +210,19 @@ class IdentityWidget(Static):
             if new_policies is not None:
                 self.app.vault.update_group_policies(group_id, group_name, new_policies)
                 self.notify(f"Policies updated for {group_name}")
-                self.run_worker(self.refresh_all())
+                self.group_graph.set_policies(group_id, new_policies)
+                self.render_entities()
+
+        graph = self.group_graph
+        inherited = set()
+        for gid in graph.ancestors(group_id) - {group_id}:
+            inherited.update(graph.groups.get(gid, {}).get("policies") or [])
+        title = f"Policies: {group_name}"
+        if inherited:
+            title += f" (inherited: {', '.join(sorted(inherited))})"
 
         self.app.push_screen(
-            PolicySelectModal(all_policies, item.group_data.get("policies", []), f"Policies: {group_name}"), 
+            PolicySelectModal(all_policies, item.group_data.get("policies", []), title), 
             handle_save
         )
 
@@ -191,7 +239,8 @@ class IdentityWidget(Static):
         group_item = group_list.highlighted_child
         group_id = group_item.group_data["id"]
         group_name = group_item.group_data["name"]
-        members = group_item.group_data.get("member_entity_ids", []) or []
+        group_data = self.app.vault.read_group(group_id) or group_item.group_data
+        members = list(group_data.get("member_entity_ids", []) or [])
 
         if add:
             if entity_id not in members: members.append(entity_id)
@@ -200,7 +249,8 @@ class IdentityWidget(Static):
 
         try:
             self.app.vault.update_group_members(group_id, group_name, members)
-            await self.refresh_all()
+            self.group_graph.set_entity_members(group_id, members)
+            self.render_entities()
             self.notify(f"Updated membership in {group_name}")
         except Exception as e:
             self.notify(f"Membership Error: {e}", severity="error")
@@ -1,19 +1,37 @@
+from functools import partial
+from rich.text import Text
 from textual import on
 from textual.app import ComposeResult
 from textual.widgets import ListView, ListItem, Label, TextArea, Input, Static
 from textual.containers import Horizontal, Vertical
+from textual.worker import get_current_worker
+
+from utils.policy_index import PolicyIndex
 
 class PoliciesWidget(Static):
     BINDINGS = [
         ("n", "new_policy", "New Policy"),
         ("ctrl+s", "save_policy", "Save"),
         ("x", "delete_policy", "Remove"),
+        ("ctrl+r", "reload_policies", "Reload"),
     ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.policy_names = []
+        self.policy_index = PolicyIndex()
+        self.search_term = ""
+        # bumped on every local save, delete or fresh read, fetch workers skip names
+        # touched after they started since the local copy is newer
+        self.generation = 0
+        self.edited_at = {}  # name -> generation of its last local save or delete
+        self.read_at = {}    # name -> generation of its last fresh read
+
     def compose(self) -> ComposeResult:
         with Horizontal():
             with Vertical(id="policy-sidebar"):
-                yield Label("POLICIES", classes="header-label")
+                yield Label("POLICIES", classes="header-label", id="policy-header")
+                yield Input(placeholder="Search policy text...", id="policy-filter")
                 yield ListView(id="policy-list")
             
             with Vertical(id="policy-editor-area"):
@@ -22,25 +40,102 @@ class PoliciesWidget(Static):
                 yield TextArea(language="yaml", id="policy-text")
 
     def on_mount(self) -> None:
-        self.refresh_policies()
+        self.refresh_policies(revalidate=True)
 
-    def refresh_policies(self):
+    def refresh_policies(self, revalidate=False):
         try:
-            policies = self.app.vault.list_policies()
-            lst = self.query_one("#policy-list", ListView)
-            lst.clear()
-            for p in sorted(policies):
-                lst.append(ListItem(Label(p), id=p))
+            self.policy_names = sorted(self.app.vault.list_policies())
+            self.policy_index.retain(self.policy_names)
+            self.render_policies()
+
+            # bodies are fetched in the background, cached ones are only re-fetched on revalidate
+            names = self.policy_names if revalidate else [n for n in self.policy_names if n not in self.policy_index]
+            if names:
+                self.run_worker(
+                    partial(self._fetch_policies, names, self.generation),
+                    thread=True,
+                    group="policy-fetch",
+                    exclusive=revalidate,
+                    exit_on_error=False
+                )
         except Exception as e:
             self.notify(f"Could not load policies: {e}", severity="error")
 
+    def _fetch_policies(self, names, started_at):
+        worker = get_current_worker()
+        bodies = self.app.vault.get_policies(names)
+        if not worker.is_cancelled:
+            self.app.call_from_thread(self._store_policies, bodies, started_at)
+
+    def _store_policies(self, bodies, started_at):
+        for name, rules in bodies.items():
+            # saved, removed or re-read since the fetch started, the local copy is newer
+            if max(self.edited_at.get(name, 0), self.read_at.get(name, 0)) > started_at:
+                continue
+            if name in self.policy_names:
+                self.policy_index.update(name, rules)
+        self.render_policies()
+
+    def _mark(self, touched, name):
+        self.generation += 1
+        touched[name] = self.generation
+
+    def render_policies(self):
+        self.run_worker(self._render_policies(), group="policy-render", exclusive=True)
+
+    async def _render_policies(self):
+        lst = self.query_one("#policy-list", ListView)
+        header = self.query_one("#policy-header", Label)
+        await lst.clear()
+
+        if not self.search_term:
+            header.update("POLICIES")
+            for p in self.policy_names:
+                item = ListItem(Label(p))
+                item.policy_name = p
+                lst.append(item)
+            return
+
+        results = self.policy_index.search(self.search_term)
+        matches = [p for p in self.policy_names if p in results]
+        status = f"{len(matches)} of {len(self.policy_names)}"
+        if len(self.policy_index) < len(self.policy_names):
+            status += f", {len(self.policy_index)} indexed"
+        header.update(f"POLICIES ({status})")
+
+        for p in matches:
+            text = Text(p, style="bold")
+            for no, line in results[p][:5]:
+                text.append(f"\n {no:>3}: {line.strip()}")
+            if len(results[p]) > 5:
+                text.append(f"\n      +{len(results[p]) - 5} more")
+            text.highlight_words([self.search_term], style="bold #00ffcc", case_sensitive=False)
+            item = ListItem(Label(text))
+            item.policy_name = p
+            lst.append(item)
+
+    @on(Input.Changed, "#policy-filter")
+    def handle_policy_filter(self, event):
+        self.search_term = event.value.strip()
+        self.render_policies()
+
     @on(ListView.Selected, "#policy-list")
     def handle_policy_selected(self, event):
-        name = event.item.id
+        name = event.item.policy_name
         self.query_one("#policy-name").value = name
         try:
-            content = self.app.vault.get_policy(name)
-            self.query_one("#policy-text").load_text(content)
+            # always read it fresh, the index may still hold an old body
+            content = self.app.vault.read_policy(name)
+            if content is None:
+                content = self.policy_index.docs.get(name)
+                self.notify(f"Could not fetch '{name}', showing the cached copy" if content is not None
+                            else f"Could not fetch '{name}'", severity="warning")
+            else:
+                self._mark(self.read_at, name)
+                if self.policy_index.docs.get(name) != content:
+                    self.policy_index.update(name, content)
+                    self.render_policies()
+            self.query_one("#policy-text").load_text(content or "")
         except Exception as e:
             self.notify(f"Error reading policy: {e}", severity="error")
 
@@ -52,6 +147,10 @@ class PoliciesWidget(Static):
         self.query_one("#policy-text").load_text(template)
         self.notify("Enter policy name and define rules")
 
+    def action_reload_policies(self):
+        self.refresh_policies(revalidate=True)
+        self.notify("Reloading policies")
+
     def action_save_policy(self):
         name = self.query_one("#policy-name").value
         rules = self.query_one("#policy-text").text
@@ -63,6 +162,8 @@ class PoliciesWidget(Static):
 
         try:
             self.app.vault.save_policy(name, rules)
+            self._mark(self.edited_at, name)
+            self.policy_index.update(name, rules)
             self.notify(f"Policy '{name}' Saved")
             self.refresh_policies()
         except Exception as e:
@@ -76,9 +177,11 @@ class PoliciesWidget(Static):
 
         try:
             self.app.vault.delete_policy(name)
+            self._mark(self.edited_at, name)
+            self.policy_index.remove(name)
             self.notify(f"Policy '{name}' removed")
             self.refresh_policies()
             self.query_one("#policy-name").value = ""
             self.query_one("#policy-text").load_text("")
         except Exception as e:
-            self.notify(f"Error during deletion: {e}", severity="error")
\ No newline at end of file
+            self.notify(f"Error during deletion: {e}", severity="error")
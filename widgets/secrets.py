@@ -1,10 +1,31 @@
 import json
+import re
+import time
+from functools import partial
+from rich.text import Text
 from textual import on
+from textual.worker import get_current_worker
 from textual.app import ComposeResult
 from textual.widgets import ListView, ListItem, Label, TextArea, Input, Static
 from textual.containers import Horizontal, Vertical
 
-from widgets.dialogs import PathDialog
+from widgets.dialogs import PathDialog, SearchDialog
+from utils.vault_client import SecretConflictError
+
+def _merge_patch(old, new):
+    # JSON merge patch (RFC 7396) that turns old into new, nested objects are diffed too
+    patch = {}
+    for key, value in new.items():
+        if value is None:
+            raise ValueError(f"'{key}' is null, a merge patch would remove it")
+        if key in old and old[key] == value:
+            continue
+        if isinstance(value, dict) and isinstance(old.get(key), dict):
+            patch[key] = _merge_patch(old[key], value)
+        else:
+            patch[key] = value
+    patch.update({key: None for key in old if key not in new})
+    return patch
 
 class SecretsWidget(Static):
     BINDINGS = [
@@ -13,12 +34,22 @@ class SecretsWidget(Static):
         ("c", "copy_secret", "Copy"),
         ("m", "move_secret", "Move"),
         ("ctrl+s", "save_secret", "Save"),
+        ("ctrl+t", "patch_secret", "Patch"),
+        ("slash", "search_secrets", "Search"),
+        ("escape", "cancel_search", "Stop Search"),
+        ("ctrl+r", "reload_secrets", "Reload"),
     ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.current_mount = ""
         self.current_path = ""
+        # what was loaded into the editor, used for check-and-set and patch
+        self.loaded_path = None
+        self.loaded_version = None
+        self.loaded_data = {}
+        self.search_worker = None
+        self.search_prefix = ""
 
     def compose(self) -> ComposeResult:
         with Horizontal():
@@ -26,44 +57,64 @@ class SecretsWidget(Static):
                 yield Label("MOUNTS", classes="header-label")
                 yield ListView(id="mount-list")
             with Vertical(id="key-container"):
-                yield Label("SECRETS", classes="header-label")
+                yield Label("SECRETS", classes="header-label", id="key-header")
                 yield ListView(id="key-list")
             with Vertical(id="editor-container"):
                 yield Label("EDITOR", classes="header-label")
                 yield Input(placeholder="Path (ex. my-app/config)", id="secret-path")
                 yield TextArea(language="json", id="secret-editor")
 
-    def on_mount(self) -> None:
-        self.refresh_mounts()
+    async def on_mount(self) -> None:
+        await self.refresh_mounts()
 
-    def refresh_mounts(self):
+    async def refresh_mounts(self):
         try:
-            mounts = self.app.vault.list_mounts()
+            vault = self.app.vault
+            # permissions may have changed since the last look, ask again
+            vault.clear_capabilities()
+            mounts = vault.list_mounts()
+            root_paths = {path: vault.secret_api_path(path, "", "list") for path in mounts}
+            caps = vault.capabilities(root_paths.values())
             lst = self.query_one("#mount-list", ListView)
-            lst.clear()
+            await lst.clear()
             for path in sorted(mounts.keys()):
+                allowed = vault.allows(caps[root_paths[path]], "list")
                 safe_id = path.replace("/", "_").strip("_")
-                item = ListItem(Label(f"󰆧 {path}"), id=f"mnt_{safe_id}")
+                item = ListItem(Label(f"{'󰆧' if allowed else '󰌾'} {path}"), id=f"mnt_{safe_id}")
                 item.vault_path = path
+                item.allowed = allowed
+                if not allowed:
+                    item.add_class("denied")
                 lst.append(item)
         except Exception as e:
             self.notify(f"Error loading mounts: {e}", severity="error")
 
     @on(ListView.Selected, "#mount-list")
     async def handle_mount_selected(self, event):
+        # a token without list may still read or write known paths, only the key list is skipped
+        if not event.item.allowed:
+            self.notify(f"No permission to list {event.item.vault_path}, open or create secrets by path", severity="warning")
         self.current_mount = event.item.vault_path
         self.current_path = ""
         await self.refresh_keys()
 
     async def refresh_keys(self):
+        self._cancel_search()
         try:
+            self.query_one("#key-header", Label).update("SECRETS")
             lst = self.query_one("#key-list", ListView)
             await lst.query("ListItem").remove() 
             
             if not self.current_mount:
                 return
 
-            keys = self.app.vault.list_keys(self.current_mount, self.current_path)
+            keys = []
+            if self.app.vault.can_secret(self.current_mount, self.current_path, "list"):
+                keys = self.app.vault.list_keys(self.current_mount, self.current_path)
+            else:
+                self.query_one("#key-header", Label).update("SECRETS (no list permission)")
+            checks = {key: (f"{self.current_path}{key}", "list" if key.endswith("/") else "read") for key in keys}
+            allowed = self.app.vault.secret_permissions(self.current_mount, checks.values())
             
             if self.current_path:
                 back_item = ListItem(Label("󰉖 .. (Back)"), id="key_back")
@@ -74,6 +125,8 @@ class SecretsWidget(Static):
             for key in keys:
                 is_dir = key.endswith("/")
                 icon = "󰉋" if is_dir else "󰏓"
+                if not allowed[checks[key]]:
+                    icon = "󰌾"
                 
                 safe_key = key.replace("/", "_").replace(".", "_")
                 unique_id = f"key_{safe_key}"
@@ -82,6 +135,9 @@ class SecretsWidget(Static):
                 item.vault_key = key
                 item.is_dir = is_dir
                 item.is_back = False
+                item.allowed = allowed[checks[key]]
+                if not item.allowed:
+                    item.add_class("denied")
                 lst.append(item)
                 
         except Exception as e:
@@ -90,6 +146,10 @@ class SecretsWidget(Static):
     @on(ListView.Selected, "#key-list")
     async def handle_key_selected(self, event):
         item = event.item
+
+        if hasattr(item, "is_search"):
+            await self.refresh_keys()
+            return
         
         if hasattr(item, "is_back") and item.is_back:
             parts = self.current_path.strip("/").split("/")
@@ -99,6 +159,10 @@ class SecretsWidget(Static):
             await self.refresh_keys()
             return
 
+        if not getattr(item, "allowed", True):
+            self.notify(f"No permission to {'list' if item.is_dir else 'read'} {item.vault_key}", severity="warning")
+            return
+
         if item.is_dir:
             self.current_path += item.vault_key 
             await self.refresh_keys()
@@ -108,7 +172,10 @@ class SecretsWidget(Static):
         self.query_one("#secret-path").value = full_key_path
         
         try:
-            data = self.app.vault.read_secret(self.current_mount, full_key_path)
+            data, version = self.app.vault.read_secret_with_version(self.current_mount, full_key_path)
+            self.loaded_path = full_key_path
+            self.loaded_version = version
+            self.loaded_data = data
             self.query_one("#secret-editor").load_text(json.dumps(data, indent=2))
         except Exception as e:
             self.notify(f"Read failed: {e}", severity="error")
@@ -120,6 +187,9 @@ class SecretsWidget(Static):
         self.query_one("#secret-path").value = ""
         self.query_one("#secret-path").focus()
         self.query_one("#secret-editor").load_text('{\n  "key": "value"\n}')
+        self.loaded_path = None
+        self.loaded_version = None
+        self.loaded_data = {}
 
     def action_save_secret(self):
         path = self.query_one("#secret-path").value
@@ -128,16 +198,155 @@ class SecretsWidget(Static):
         if not path:
             self.notify("Path is missing!", severity="error")
             return
+        if not self.app.vault.can_secret(self.current_mount, path, "write"):
+            self.notify(f"No permission to write {path}", severity="error")
+            return
         try:
             data = json.loads(raw_content)
-            self.app.vault.save_secret(self.current_mount, path, data)
+            # anything but the loaded secret is saved as new, cas=0 refuses to overwrite one that exists
+            cas = self.loaded_version if path == self.loaded_path else 0
+            version = self.app.vault.save_secret(self.current_mount, path, data, cas=cas)
+            self.loaded_path = path
+            self.loaded_version = version
+            self.loaded_data = data
             self.notify(f"Saved '{path}'")
             self.run_worker(self.refresh_keys())
         except json.JSONDecodeError:
             self.notify("Invalid JSON format!", severity="error")
+        except SecretConflictError as e:
+            hint = "Open it to edit it" if cas == 0 else "Reload the secret first"
+            self.notify(f"Save rejected: {e}. {hint}.", severity="error")
         except Exception as e:
             self.notify(f"Save failed: {e}", severity="error")
 
+    def action_patch_secret(self):
+        path = self.query_one("#secret-path").value
+        raw_content = self.query_one("#secret-editor").text
+
+        if not path or path != self.loaded_path or self.loaded_version is None:
+            self.notify("Patch needs a loaded KV v2 secret, use Save instead", severity="warning")
+            return
+        if not self.app.vault.can_secret(self.current_mount, path, "patch"):
+            self.notify(f"No permission to patch {path}, use Save instead", severity="error")
+            return
+        try:
+            data = json.loads(raw_content)
+            changes = _merge_patch(self.loaded_data, data)
+            if not changes:
+                self.notify("Nothing to patch")
+                return
+
+            self.loaded_version = self.app.vault.patch_secret(self.current_mount, path, changes, cas=self.loaded_version)
+            self.loaded_data = data
+            self.notify(f"Patched {len(changes)} field(s) in '{path}'")
+        except json.JSONDecodeError:
+            self.notify("Invalid JSON format!", severity="error")
+        except ValueError as e:
+            self.notify(f"Cannot patch: {e}, use Save instead", severity="error")
+        except SecretConflictError as e:
+            self.notify(f"Patch rejected: {e}. Reload the secret first.", severity="error")
+        except Exception as e:
+            self.notify(f"Patch failed: {e}", severity="error")
+
+    def action_search_secrets(self):
+        if not self.current_mount:
+            self.notify("Choose mount path first!", severity="warning")
+            return
+
+        def handle_search(result):
+            if not result:
+                return
+            pattern, regex = result
+            if regex:
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    self.notify(f"Invalid regex: {e}", severity="error")
+                    return
+            self.run_worker(self.start_search(pattern, regex))
+
+        self.app.push_screen(SearchDialog(f"{self.current_mount}{self.current_path}"), handle_search)
+
+    async def start_search(self, pattern, regex):
+        self._cancel_search()
+        lst = self.query_one("#key-list", ListView)
+        await lst.clear()
+
+        header = ListItem(Label(Text(f"󰍉 Results for '{pattern}' (select to close)")))
+        header.is_search = True
+        header.is_dir = False
+        lst.append(header)
+
+        self.search_prefix = self.current_path
+        self.search_worker = self.run_worker(
+            partial(self._run_search, self.current_mount, self.current_path, pattern, regex),
+            thread=True,
+            group="search",
+            exit_on_error=False
+        )
+
+    def _run_search(self, mount, prefix, pattern, regex):
+        # runs in a thread, results are handed to the UI in batches
+        worker = get_current_worker()
+        started = last_flush = time.monotonic()
+        scanned = found = 0
+        batch = []
+
+        try:
+            results = self.app.vault.search_secrets(mount, prefix, pattern, regex, cancelled=lambda: worker.is_cancelled)
+            for path, hits in results:
+                if worker.is_cancelled:
+                    return
+                scanned += 1
+                if hits:
+                    found += 1
+                    batch.append((path, hits))
+                if time.monotonic() - last_flush > 0.2:
+                    self.app.call_from_thread(self._show_search_results, worker, batch, scanned)
+                    batch = []
+                    last_flush = time.monotonic()
+        except Exception as e:
+            self.app.call_from_thread(self.notify, f"Search failed: {e}", severity="error")
+            return
+
+        if worker.is_cancelled:
+            return
+        self.app.call_from_thread(self._show_search_results, worker, batch, scanned)
+        self.app.call_from_thread(
+            self.notify, f"Searched {scanned} secrets in {time.monotonic() - started:.1f}s, {found} matching"
+        )
+
+    def _show_search_results(self, worker, batch, scanned):
+        if worker is not self.search_worker or worker.is_cancelled:
+            return
+        lst = self.query_one("#key-list", ListView)
+        for path, hits in batch:
+            # secret paths and field names are not markup
+            text = Text(f"󰏓 {path}")
+            for field, snippet in hits:
+                text.append(f"\n   {field}: {snippet}")
+            item = ListItem(Label(text))
+            item.vault_key = path[len(self.search_prefix):]
+            item.is_dir = False
+            item.is_back = False
+            lst.append(item)
+        self.query_one("#key-header", Label).update(f"SECRETS (searched {scanned})")
+
+    def _cancel_search(self):
+        if self.search_worker and self.search_worker.is_running:
+            self.search_worker.cancel()
+            return True
+        return False
+
+    def action_cancel_search(self):
+        if self._cancel_search():
+            self.notify("Search stopped")
+
+    async def action_reload_secrets(self):
+        await self.refresh_mounts()
+        await self.refresh_keys()
+        self.notify("Reloaded mounts and permissions")
+
     def action_confirm_delete(self):
         lst = self.query_one("#key-list", ListView)
         if lst.highlighted_child:
@@ -156,14 +365,17 @@ class SecretsWidget(Static):
         def handle_copy(new_path):
             if new_path and new_path != source:
                 try:
-                    source_item = self.query_one("#key-list").highlighted_child
-                    data = self.app.vault.read_secret(source_item.vault_mount, source_item.vault_key)
-                    
                     parts = new_path.strip("/").split("/", 1)
                     new_mount = parts[0]
                     new_secret_path = parts[1] if len(parts) > 1 else ""
+                    if not self.app.vault.can_secret(new_mount, new_secret_path, "write"):
+                        self.notify(f"No permission to write {new_path}", severity="error")
+                        return
+                    
+                    data = self.app.vault.read_secret(self.current_mount, source)
                 
-                    self.app.vault.save_secret(new_mount, new_secret_path, data)
+                    # cas=0 only creates, an existing destination is never overwritten
+                    self.app.vault.save_secret(new_mount, new_secret_path, data, cas=0)
                     self.notify(f"Copied to {new_path}")
                     self.current_mount = new_mount
                     self.refresh_keys()
@@ -177,15 +389,21 @@ class SecretsWidget(Static):
         def handle_move(new_path):
             if new_path and new_path != source:
                 try:
-                    source_item = self.query_one("#key-list").highlighted_child
-                    data = self.app.vault.read_secret(source_item.vault_mount, source_item.vault_key)
-                
                     parts = new_path.strip("/").split("/", 1)
                     new_mount = parts[0]
                     new_secret_path = parts[1] if len(parts) > 1 else ""
+                    if not self.app.vault.can_secret(new_mount, new_secret_path, "write"):
+                        self.notify(f"No permission to write {new_path}", severity="error")
+                        return
+                    if not self.app.vault.can_secret(self.current_mount, source, "delete"):
+                        self.notify(f"No permission to remove {source}", severity="error")
+                        return
+                
+                    data = self.app.vault.read_secret(self.current_mount, source)
                 
-                    self.app.vault.save_secret(new_mount, new_secret_path, data)
-                    self.app.vault.delete_secret(source_item.vault_mount, source_item.vault_key)
+                    # cas=0 only creates, an existing destination is never overwritten
+                    self.app.vault.save_secret(new_mount, new_secret_path, data, cas=0)
+                    self.app.vault.delete_secret(self.current_mount, source)
                     
                     self.notify(f"Moved to {new_path}")
                     self.current_mount = new_mount